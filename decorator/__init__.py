@@ -7,12 +7,15 @@
 这里的类实现装饰器的调用一般为@classname()，注意括号
 """
 
+import logging
 import random
 import time
-from threading import Lock
+from threading import RLock
 
 import wrapt
 
+logger = logging.getLogger(__name__)
+
 
 class Logging(object):
     pass
@@ -22,22 +25,24 @@ class TimeIt(object):
     """
     计算某函数耗时
 
+    使用单调时钟 perf_counter_ns 计时，结果以 DEBUG 级别输出到 logging
+
     TODO: 加入时间格式化参数
     """
 
     @wrapt.decorator
     def __call__(self, wrapped, instance, args, kwargs):
-        begin_time = time.time()
+        t0 = time.perf_counter_ns()
         func = wrapped(*args, **kwargs)
-        end_time = time.time()
-        time_consumed = end_time - begin_time
-        print(f'{wrapped.__name__} took {time_consumed} secs')
+        dt = time.perf_counter_ns() - t0
+        # 惰性格式化，日志级别关闭时不会拼接字符串
+        logger.debug('%s took %.6f ms', wrapped.__name__, dt / 1e6)
         return func
 
 
 class Retry(object):
     """
-    任意异常后重试
+    任意异常后重试，重试间隔按指数退避并加入随机抖动
 
     造轮子，应该使用 tenacity
     """
@@ -49,34 +54,41 @@ class Retry(object):
 
     @wrapt.decorator
     def __call__(self, wrapped, instance, args, kwargs):
-        for _ in range(self.retry_times):
+        for attempt in range(self.retry_times):
             try:
                 return wrapped(*args, **kwargs)
             except self.errors as e:
                 print(e)
-                time.sleep((random.random() + 1) * self.wait_secs)
-            return None
+                # 最后一次失败后不必再等待
+                if attempt < self.retry_times - 1:
+                    time.sleep(self.wait_secs * (2 ** attempt) * (0.5 + random.random()))
+        return None
 
 
 class Singleton:
     """
     单例模式
 
-    使用了线程锁，但不确定是否真的线程安全
+    使用双重检查锁：已有实例时直接返回，不必加锁；没有实例时加锁后再检查一次，避免多线程重复创建
     """
 
     def __init__(self):
-        self.lock = Lock()
+        self.lock = RLock()  # 可重入，允许单例的构造过程中再创建其他单例
         self._instance = {}  # 用来记录实例
 
     @wrapt.decorator
     def __call__(self, wrapped, instance, args, kwargs):
-        # 没有实例才创建
-        if wrapped not in self._instance:
-            with self.lock:
-                self._instance[wrapped] = wrapped()
-        # 返回 self._instance 里的实例，已经有了就不会再新建
-        return self._instance[wrapped]
+        # 已经有了就不会再新建，直接返回 self._instance 里的实例
+        inst = self._instance.get(wrapped)
+        if inst is not None:
+            return inst
+        with self.lock:
+            # 加锁后再检查一次，防止等待锁期间其他线程已经创建
+            inst = self._instance.get(wrapped)
+            if inst is None:
+                inst = wrapped(*args, **kwargs)
+                self._instance[wrapped] = inst
+            return inst
 
 
 if __name__ == '__main__':
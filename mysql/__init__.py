@@ -11,16 +11,31 @@ __author__ = 'Laurent.Chen'
 __date__ = '2019/7/15'
 __version__ = '1.0.0'
 
+import functools
 import os
 import yaml
 import MySQLdb
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-# 注意相对路径与绝对路径在 直接run/import 和 execute in console 中是不一样的
-# 仅供导入而不会 execute in console 的用以下做法
-with open(os.path.join(os.path.dirname(__file__), 'config.yaml'), 'r', encoding='utf-8') as f:
-    config_dict = yaml.full_load(f)
+
+@functools.lru_cache(maxsize=1)
+def _config():
+    """
+    读取配置文件，首次调用时才解析并缓存结果。优先使用 libyaml 的 CSafeLoader
+
+    :return: 配置字典
+    :rtype: dict
+    """
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    # 注意相对路径与绝对路径在 直接run/import 和 execute in console 中是不一样的
+    # 仅供导入而不会 execute in console 的用以下做法
+    with open(os.path.join(os.path.dirname(__file__), 'config.yaml'), 'r', encoding='utf-8') as f:
+        return yaml.load(f, Loader=loader)
+
+
+# 按 (user, host, port, db) 缓存 engine，避免每次操作都重新建立连接池
+_ENGINE_CACHE = {}
 
 
 class Connector(object):
@@ -30,31 +45,43 @@ class Connector(object):
     :param str db: 连接数据库名称
     """
 
-    host = config_dict['host']
-    port = config_dict['port']
-    user = config_dict['user']
-    password = config_dict['password']
-    charset = config_dict['charset']
-
     def __init__(self, db):
         if not isinstance(db, str):
             raise ValueError('必须以字符串类型传入数据库名')
         self.db = db
 
+        config_dict = _config()
+        self.host = config_dict['host']
+        self.port = config_dict['port']
+        self.user = config_dict['user']
+        self.password = config_dict['password']
+        self.charset = config_dict['charset']
+
     def get_conn(self):
-        # 可供 pandas.read_sql 使用的数据库连接
+        # 可供 pandas.read_sql 使用的数据库连接，开启 local_infile 以支持 LOAD DATA LOCAL INFILE
         conn = MySQLdb.connect(host=self.host, port=self.port, user=self.user,
-                               password=self.password, db=self.db, charset=self.charset)
+                               password=self.password, db=self.db, charset=self.charset, local_infile=1)
         return conn
 
     def get_engine(self):
         """
         根据设定连接参数返回一个 SQLAlchemy engine 对象，目前使用 ORM
 
+        同一组连接参数只会创建一次 engine，之后复用其连接池
+
+        开启 MySQL 协议压缩，大批量 INSERT / SELECT 经广域网传输时数据包可缩小数倍。
+        mysqlclient 的 executemany 本身就会把 INSERT ... VALUES 合并为多行语句，无需另行设置
+
         :return: SQLAlchemy engine
         """
-        engine = create_engine(f"mysql+mysqldb://{self.user}:{self.password}@{self.host}:{self.port}/{self.db}"
-                               f"?charset=utf8mb4")
+        key = (self.user, self.host, self.port, self.db)
+        engine = _ENGINE_CACHE.get(key)
+        if engine is None:
+            engine = create_engine(f"mysql+mysqldb://{self.user}:{self.password}@{self.host}:{self.port}/{self.db}"
+                                   f"?charset=utf8mb4&local_infile=1",
+                                   pool_size=10, max_overflow=20, pool_pre_ping=True, pool_recycle=3600,
+                                   connect_args={'compress': True, 'autocommit': False})
+            engine = _ENGINE_CACHE.setdefault(key, engine)
         return engine
 
     def get_session(self):
@@ -13,15 +13,58 @@
 
 TODO: 每次操作写入记录表的装饰器，取代以往的 progress_registration()。抑或是使用 logging 输出文本日志？
 """
+import csv
+import functools
+import os
+import tempfile
 from contextlib import contextmanager
 
+import pandas as pd
+from sqlalchemy import select, text
 from sqlalchemy.dialects.mysql import insert
 from sqlalchemy.inspection import inspect
-from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import scoped_session, sessionmaker
 
 from mysql import Connector
 
 
+def _to_tsv_value(value):
+    """
+    转换 object 列中的单个值以供 LOAD DATA 读取：布尔值转为 1/0，字符串中的反斜杠加倍以免被 MySQL 当作转义符
+    """
+    # is_bool 同时识别 python 与 numpy 的布尔值
+    if pd.api.types.is_bool(value):
+        return int(value)
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\')
+    return value
+
+
+@functools.lru_cache(maxsize=None)
+def _column_cache(target_table, temp_table):
+    """
+    解析临时表的列与主键信息。表结构固定，故按 (target_table, temp_table) 缓存，每对表只反射一次
+
+    :param SQLAlchemy.ext.declarative.api.DeclarativeMeta target_table: 目标表类
+    :param SQLAlchemy.ext.declarative.api.DeclarativeMeta temp_table: 临时表类
+    :return: (bare_column_list, column_list, bare_pk_list, pk_list)，均不可变
+    :rtype: tuple
+    """
+    temp_inspect = inspect(temp_table)
+
+    pk_list = tuple(temp_inspect.primary_key)
+    # 不带有表信息的单纯列名
+    bare_pk_list = tuple(k.name for k in pk_list)
+
+    # 获取临时表中除主键(**这里要求只有 MySQL 的自增ID单一字段**)的其他列
+    # 由于是先行按照 temp 表结构建表，所以即便原始数据源表字段有所增加。只要第一步 to_sql 到临时表没有问题，这里就不会出现问题
+    pk_names = set(bare_pk_list)
+    column_list = tuple(c for c in temp_inspect.columns if c.name not in pk_names)
+    bare_column_list = tuple(c.key for c in column_list)
+
+    return bare_column_list, column_list, bare_pk_list, pk_list
+
+
 class Operation(object):
     """
     自定义 MySQL 数据库读写操作
@@ -32,6 +75,9 @@ class Operation(object):
     def __init__(self, db):
         self.db = db
         self.engine = Connector(db=self.db).get_engine()
+        # session 工厂与线程局部的 scoped_session 注册表均只在此创建一次，供 _session_scope 复用
+        self._Session = sessionmaker(bind=self.engine)
+        self._Scoped = scoped_session(self._Session)
 
     @contextmanager
     def _session_scope(self, scoped=True):
@@ -45,10 +91,7 @@ class Operation(object):
         >>>     # Some sql operations
         >>>     pass
         """
-        if not scoped:
-            session = Connector(db=self.db).get_session()
-        else:
-            session = scoped_session(Connector(db=self.db).get_session)
+        session = self._Scoped() if scoped else self._Session()
         try:
             yield session
             session.commit()
@@ -56,7 +99,24 @@ class Operation(object):
             session.rollback()
             raise e
         finally:
-            session.close()
+            if scoped:
+                self._Scoped.remove()
+            else:
+                session.close()
+
+    @staticmethod
+    def _drop_temp_table(temp_table, session):
+        """
+        删除当前连接上的临时表
+
+        必须写明 TEMPORARY：普通的 DROP TABLE 会隐式提交当前事务，而 DROP TEMPORARY TABLE 不会，
+        事务边界仍由 _session_scope 控制。IF EXISTS 也省去了 checkfirst 额外的一次查询
+
+        :param SQLAlchemy.ext.declarative.api.DeclarativeMeta temp_table: 临时表类
+        :param session: 数据库会话
+        :return: None
+        """
+        session.execute(text(f'DROP TEMPORARY TABLE IF EXISTS `{temp_table.__tablename__}`'))
 
     @staticmethod
     def _my_insert(target_table, temp_table, session, if_record_exists):
@@ -77,43 +137,164 @@ class Operation(object):
 
         :return: None
         """
-        temp_inspect = inspect(temp_table)
-
-        # 类型需要先转化为 python 列表
-        column_list = [c for c in temp_inspect.columns]
-        pk_list = [k for k in temp_inspect.primary_key]
-
-        # 不带有表信息的单纯列名
-        bare_column_list = [c.key for c in temp_inspect.columns]
-        bare_pk_list = [k.name for k in temp_inspect.primary_key]
-
-        # 获取临时表中除主键(**这里要求只有 MySQL 的自增ID单一字段**)的其他列名
-        # 由于是先行按照 temp 表结构建表，所以即便原始数据源表字段有所增加。只要第一步 to_sql 到临时表没有问题，这里就不会出现问题
-        for k in bare_pk_list:
-            bare_column_list.remove(k)
-
-        for k in pk_list:
-            column_list.remove(k)
+        bare_column_list, column_list, _, _ = _column_cache(target_table, temp_table)
 
         # TODO: 能否有更好的方法避免现在类似拼接字符串的做法？ SqlAlchemy 的 load_only 方法无效
+        # 使用 Core 的 select 而非 session.query，生成的 SQL 相同但省去 ORM 层的开销
         if if_record_exists == 'update':
-            stmt = insert(target_table).from_select(bare_column_list, session.query(*column_list))
+            stmt = insert(target_table).from_select(bare_column_list, select(list(column_list)))
             update_dict = {column: stmt.inserted[f'{column}'] for column in bare_column_list}
             stmt = stmt.on_duplicate_key_update(update_dict)
         elif if_record_exists == 'ignore':
-            stmt = insert(target_table).from_select(bare_column_list, session.query(*column_list))
+            stmt = insert(target_table).from_select(bare_column_list, select(list(column_list)))
             stmt = stmt.prefix_with('IGNORE')
         else:
             raise ValueError('if_record_exists 参数只接受 update 或 ignore')
         session.execute(stmt)
 
-    def to_mysql(self, df, target_table, temp_table, if_record_exists):
+    def upsert_df(self, df, target_table, if_record_exists, chunksize=None):
         """
-        指定DataFrame, 目标表和对应临时表，执行插入操作。可选择 **更新** 或 **忽略** 重复记录
+        不经临时表，直接将 DataFrame 分批以多行 INSERT 写入目标表。可选择 **更新** 或 **忽略** 重复记录
+
+        相比临时表方案省去了建表 DDL 和 INSERT ... SELECT 的全表扫描，写入数据量减半
+
+        注意：'update' 仅更新 df 中出现的非主键字段，df 中缺失的字段保持原值。若 df 中只有主键字段，则退化为 'ignore'。
+        df 中出现目标表没有的字段时报错
 
         :param DataFrame df: 数据表
         :param SQLAlchemy.ext.declarative.api.DeclarativeMeta target_table: 目标表类
-        :param SQLAlchemy.ext.declarative.api.DeclarativeMeta temp_table: 临时表类
+        :param str if_record_exists: {'update', 'ignore'}
+
+            - 'update': 相当于执行 INSERT INTO target_table (column_list) VALUES (...), (...) ON DUPLICATE KEY UPDATE
+                        col=VALUES(col)
+            - 'ignore': 相当于执行 INSERT IGNORE INTO target_table (column_list) VALUES (...), (...)
+
+        :param int chunksize: 每批写入的行数。默认为 None，按 2000 // 列数 估算
+        :return: None
+        """
+        if if_record_exists not in ('update', 'ignore'):
+            raise ValueError('if_record_exists 取值必须为"update"或"ignore"')
+
+        if df is None:
+            return
+
+        if chunksize is None:
+            chunksize = max(1, 2000 // max(1, len(df.columns)))
+
+        target_inspect = inspect(target_table)
+        pk_names = {k.name for k in target_inspect.primary_key}
+        columns = list(df.columns)
+
+        # 目标表中不存在的字段会被 SQLAlchemy 静默忽略，需先行检查报错，与临时表方案"增：报错"保持一致
+        unknown_columns = set(columns) - {c.key for c in target_inspect.columns}
+        if unknown_columns:
+            raise ValueError(f'目标表 {target_table.__tablename__} 中不存在以下字段: '
+                             f'{", ".join(sorted(map(str, unknown_columns)))}')
+
+        # 空表无需开启 session 写入，直接返回
+        if len(df) == 0:
+            return
+
+        # 语句只构建一次，各批以 executemany 方式传参，由 mysqlclient 改写为单条多行 INSERT
+        stmt = insert(target_table)
+        update_dict = {}
+        if if_record_exists == 'update':
+            update_dict = {column: stmt.inserted[column] for column in columns if column not in pk_names}
+        # df 中只有主键字段时没有可更新的字段，on_duplicate_key_update({}) 会报错，退化为 IGNORE
+        if update_dict:
+            stmt = stmt.on_duplicate_key_update(update_dict)
+        else:
+            stmt = stmt.prefix_with('IGNORE')
+
+        with self._session_scope() as session:
+            # 逐批转换，避免一次性将整个 df 展开为 dict 列表
+            for i in range(0, len(df), chunksize):
+                sub = df.iloc[i: i + chunksize]
+                # NaN 需转为 None 才能写入 NULL，与 to_sql 的处理保持一致
+                sub = sub.astype(object).where(pd.notnull(sub), None)
+                rows = [dict(zip(columns, t)) for t in sub.itertuples(index=False, name=None)]
+                session.execute(stmt, rows)
+
+    def bulk_load_csv(self, df, target_table, temp_table=None, if_record_exists='ignore'):
+        """
+        先将 DataFrame 导出为本地临时 tsv 文件，再以 LOAD DATA LOCAL INFILE 批量导入，适合大表写入
+
+        绕过了逐行的 SQL 解析与参数绑定，通常比多行 INSERT 快一到两个数量级。要求服务端开启 local_infile
+
+        - 不指定 temp_table 时直接导入目标表，重复记录（由唯一索引确定）一律忽略
+        - 指定 temp_table 时先导入临时表，再按 if_record_exists 执行 INSERT ... SELECT，同 _my_insert
+
+        导出前布尔值会转为 1/0，字符串中的反斜杠会加倍转义，不会改动传入的 df
+
+        :param DataFrame df: 数据表
+        :param SQLAlchemy.ext.declarative.api.DeclarativeMeta target_table: 目标表类
+        :param SQLAlchemy.ext.declarative.api.DeclarativeMeta temp_table: 临时表类，默认为 None
+        :param str if_record_exists: {'update', 'ignore'}，仅指定 temp_table 时生效，默认 'ignore'
+        :return: None
+        """
+        if if_record_exists not in ('update', 'ignore'):
+            raise ValueError('if_record_exists 取值必须为"update"或"ignore"')
+        if if_record_exists == 'update' and temp_table is None:
+            raise ValueError('if_record_exists 为"update"时必须指定 temp_table')
+
+        if df is None or len(df) == 0:
+            return
+
+        # to_csv 会把布尔值写为 True/False，而 LOAD DATA 默认以反斜杠为转义符，故需先行转换布尔列与 object 列
+        convert_columns = [column for column in df.columns if df[column].dtype in (bool, object)]
+
+        fd, tmp_path = tempfile.mkstemp(suffix='.tsv')
+        try:
+            # 分批转换并追加写入，额外内存只占一批的大小，不会整表复制
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                for i in range(0, len(df), 100000):
+                    sub = df.iloc[i: i + 100000]
+                    if convert_columns:
+                        converted = {}
+                        for column in convert_columns:
+                            if sub[column].dtype == bool:
+                                converted[column] = sub[column].astype(int)
+                            else:
+                                converted[column] = sub[column].map(_to_tsv_value)
+                        sub = sub.assign(**converted)
+                    sub.to_csv(f, sep='\t', header=False, index=False, na_rep='\\N', line_terminator='\n',
+                               quoting=csv.QUOTE_MINIMAL, quotechar='"')
+
+            column_sql = ', '.join(f'`{column}`' for column in df.columns)
+            load_sql = ("LOAD DATA LOCAL INFILE '{path}' {ignore}INTO TABLE `{table}` CHARACTER SET utf8mb4 "
+                        "FIELDS TERMINATED BY '\\t' OPTIONALLY ENCLOSED BY '\"' "
+                        "LINES TERMINATED BY '\\n' ({columns})")
+            # SQL 字符串中的路径统一使用正斜杠，避免 windows 下的反斜杠被当作转义符
+            load_sql = load_sql.format(path=tmp_path.replace('\\', '/'), columns=column_sql,
+                                       ignore='' if temp_table is not None else 'IGNORE ',
+                                       table=(temp_table or target_table).__tablename__)
+
+            with self._session_scope() as session:
+                if temp_table is None:
+                    session.execute(text(load_sql))
+                else:
+                    # 连接会归还连接池复用，临时表不会随之删除，故用完即删，同 to_mysql
+                    temp_table.__table__.create(bind=session.connection(), checkfirst=False)
+                    try:
+                        session.execute(text(load_sql))
+                        self._my_insert(target_table=target_table, temp_table=temp_table, session=session,
+                                        if_record_exists=if_record_exists)
+                    finally:
+                        self._drop_temp_table(temp_table, session)
+        finally:
+            os.remove(tmp_path)
+
+    def to_mysql(self, df, target_table, temp_table, if_record_exists, chunksize=None, method='multi',
+                 use_temp_table=False):
+        """
+        指定DataFrame 和目标表，执行插入操作。可选择 **更新** 或 **忽略** 重复记录
+
+        默认直接调用 upsert_df，将 df 分批以多行 INSERT 写入目标表；指定 use_temp_table=True 时沿用旧的临时表方案
+
+        :param DataFrame df: 数据表
+        :param SQLAlchemy.ext.declarative.api.DeclarativeMeta target_table: 目标表类
+        :param SQLAlchemy.ext.declarative.api.DeclarativeMeta temp_table: 临时表类，仅 use_temp_table=True 时使用，
+            否则可传入 None
         :param str if_record_exists: {'update', 'ignore'}
 
             选择对已存在记录（由唯一索引确定）的处理策略
@@ -122,12 +303,12 @@ class Operation(object):
 
                         相当于执行::
 
-                            INSERT INTO target_table (column_list) SELECT column_list FROM temp_table ON DUPLICATE KEY
+                            INSERT INTO target_table (df_columns) VALUES (...), (...) ON DUPLICATE KEY
                             UPDATE col=VALUES(col)
 
-                        注意，INSERT INTO ... ON DUPLICATE KEY UPDATE 与 REPLACE INTO 不同，不会伤及其他无关字段，
-                        从而允许仅个别字段发生变化。但本方法中指定的 column_list 为 table 类中定义的表结构（也即全表更新），
-                        故不能支持灵活地就某一部分字段进行更新，同时还不伤及其他字段
+                        注意，INSERT INTO ... ON DUPLICATE KEY UPDATE 与 REPLACE INTO 不同，不会伤及其他无关字段。
+                        这里只更新 df 中出现的非主键字段，df 中没有的字段保持原值，从而允许仅对部分字段进行更新。
+                        若 df 中只有主键字段，则退化为 INSERT IGNORE
 
                         而且如果记录完全一样。那么 MySQL 受影响行数为0，自身的 update_time 也不会发生变化
 
@@ -137,21 +318,54 @@ class Operation(object):
 
                         相当于执行::
 
-                            INSERT IGNORE INTO target_table (column_list) SELECT column_list FROM temp_table
+                            INSERT IGNORE INTO target_table (df_columns) VALUES (...), (...)
+
+        :param int chunksize: 每批 INSERT 的行数。默认为 None，按 2000 // 列数 估算，
+            以免单条多行 INSERT 超出 MySQL 的 max_allowed_packet
+        :param str or None method: 透传给 to_sql 的 method 参数，仅临时表方案使用。默认 'multi'，即单条 INSERT 写入多行
+            以减少网络往返；传入 None 则退回 pandas 默认的逐行 INSERT
+        :param bool use_temp_table: 是否沿用临时表方案，默认否。为 True 时须指定 temp_table
+
+            先将 df 以 to_sql 写入临时表，再执行::
+
+                INSERT INTO target_table (column_list) SELECT column_list FROM temp_table ON DUPLICATE KEY
+                UPDATE col=VALUES(col)
+
+            或::
+
+                INSERT IGNORE INTO target_table (column_list) SELECT column_list FROM temp_table
+
+            其中 column_list 为临时表类中定义的除主键外的全部字段（也即全表更新），df 中没有的字段会被更新为临时表中的
+            默认值，故不能只就某一部分字段进行更新而不伤及其他字段
 
         :return: None
         """
         if if_record_exists not in ('update', 'ignore'):
             raise ValueError('if_record_exists 取值必须为"update"或"ignore"')
 
-        # 临时表在线程中断时就会自动删除，故需要保持在同一线程下完成操作
+        if use_temp_table and temp_table is None:
+            raise ValueError('use_temp_table 为 True 时必须指定 temp_table')
+
+        # 参数检查完毕后，空表无需建临时表和写入，直接返回
+        if df is None or len(df) == 0:
+            return
+
+        if not use_temp_table:
+            self.upsert_df(df, target_table=target_table, if_record_exists=if_record_exists, chunksize=chunksize)
+            return
+
+        if chunksize is None:
+            chunksize = max(1, 2000 // max(1, len(df.columns)))
+
+        # 临时表只在创建它的连接上可见，故需要保持在同一 session（连接）下完成操作
         with self._session_scope() as session:
-            # create 方法生成临时表，注意其 checkfirst 参数默认取False，如果表已存在则抛出异常。但既然是临时表就不会有这问题
+            # create 方法生成临时表，注意其 checkfirst 参数默认取False，如果表已存在则抛出异常。
+            # engine 会被缓存复用，连接归还连接池后临时表并不会随之删除，故必须在 finally 中显式删除
             temp_table.__table__.create(bind=session.connection(), checkfirst=False)
 
             try:
                 df.to_sql(temp_table.__tablename__, con=session.connection(),
-                          if_exists='append', index=False, chunksize=1000)
+                          if_exists='append', index=False, chunksize=chunksize, method=method)
                 # 插入临时表时，如果 df 与目标数据库表结构字段不同（以下为 df 相对变化）:
                 #   - 增：报错
                 #   - 删：只插入对应字段
@@ -161,6 +375,8 @@ class Operation(object):
             else:
                 self._my_insert(target_table=target_table, temp_table=temp_table, session=session,
                                 if_record_exists=if_record_exists)
+            finally:
+                self._drop_temp_table(temp_table, session)
 
 
 if __name__ == '__main__':
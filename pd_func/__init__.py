@@ -5,9 +5,12 @@
 各种常用 pandas 的定制函数
 """
 
+import math
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
 
 
@@ -20,16 +23,14 @@ def list_file_in_path(folder_path, pattern=None):
     :return: 符合要求的文件列表
     :type: list
     """
-    filename_list = os.listdir(folder_path)
+    regex = re.compile(pattern) if pattern else None
     pathname = []
 
-    for filename in filename_list:
-        if pattern:
-            filename = re.match(pattern=pattern, string=filename)
-            if filename:
-                pathname.append(os.path.join(folder_path, filename.group(0)))
-        if not pattern:
-            pathname.append(os.path.join(folder_path, filename))
+    # scandir 返回的 DirEntry 自带完整路径，无需再 os.path.join
+    with os.scandir(folder_path) as it:
+        for entry in it:
+            if regex is None or regex.match(entry.name):
+                pathname.append(entry.path)
 
     return pathname
 
@@ -40,36 +41,56 @@ def better_read_excel(pathname, *args, **kwargs):
 
     由于存在后续合并和重置 index 的问题，似乎没法简单地用偏函数 sheet_name=None 实现
 
+    其余参数原样传给 read_excel。pandas >= 2.2 时可传入 engine='calamine'（需安装 python-calamine）以大幅加快解析
+
     :param str pathname: 目标单个 excel 路径
     :return: 返回合并表
     :rtype: DataFrame
     """
-    content_list = []
     # 显式声明 sheet_name=None 以读取所有 sheet，返回 OrderedDict
     content = pd.read_excel(pathname, sheet_name=None, *args, **kwargs)
-    for k, v in content.items():
-        content_list.append(v)
-    df = pd.concat(content_list)
-    df = df.reset_index(drop=True)
-    return df
+    # ignore_index 在合并时直接生成新 index，省去 reset_index 的一次复制
+    return pd.concat(content.values(), ignore_index=True)
+
+
+def _read_excel_job(job):
+    # 进程池只能分发可 pickle 的顶层函数，故将 (文件, args, kwargs) 打包传入
+    file, args, kwargs = job
+    return better_read_excel(file, *args, **kwargs)
 
 
-def read_folder_excel(folder_path, pattern=None, *args, **kwargs):
+def read_folder_excel(folder_path, pattern=None, *args, max_workers=None, **kwargs):
     """
     打开指定文件夹内的文件名符合 pattern 的全部 excel 文件， 并将它们 append 合并为单个 DataFrame
 
     需要保证文件夹内文件名符合 pattern 的文件都是同型的 excel 表格。允许单个 excel 中有多张 sheet，但它们都必须同型
 
+    excel 解析受 GIL 限制，故使用多进程并行读取各文件。注意 windows 下调用方脚本需置于 if __name__ == '__main__' 之下。
+    另外 args 和 kwargs 需要 pickle 传给子进程，lambda 等不可 pickle 的参数（如 converters={'col': lambda x: ...}）
+    会报 PicklingError，此时可指定 max_workers=1 在当前进程内依次读取
+
     :param str folder_path: 指定路径，确保路径内文件名符合 pattern 的只有同型的 excel 文件
     :param str pattern: 正则表达式。默认为 None，路径下所有文件都将被纳入
+    :param int max_workers: 进程数。默认为 None，即 CPU 核数，且不超过文件数。内存占用随进程数线性增长。
+        为 1 时不开进程池，直接在当前进程内读取
     :return: 返回合并表
     :rtype: DataFrame
     """
     pathname = list_file_in_path(folder_path, pattern=pattern)
-    content_list = []
-    for file in pathname:
-        file_df = better_read_excel(file, *args, **kwargs)
-        content_list.append(file_df)
+    jobs = [(file, args, kwargs) for file in pathname]
+    if not jobs:
+        raise ValueError(f'{folder_path} 下没有文件名符合 pattern 的文件')
+
+    # 进程数不超过文件数；windows 下 ProcessPoolExecutor 最多只支持 61 个进程
+    max_workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+    if os.name == 'nt':
+        max_workers = min(max_workers, 61)
+
+    if max_workers == 1:
+        content_list = [_read_excel_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            content_list = list(executor.map(_read_excel_job, jobs, chunksize=1))
     result = pd.concat(content_list, ignore_index=True)
     return result
 
@@ -78,7 +99,7 @@ def better_to_excel(df, pathname, mode='a', rows_per_sheet=1000000, **kwargs):
     """
     更好的 DataFrame 导出 excel 方法
 
-        - 超过一百万行时，自动切分 sheet 导出
+        - 超过 rows_per_sheet（默认一百万）行时，自动均分为多张 sheet 导出
         - 默认允许追加至一个已存在 excel 的新 sheet 中
 
     另外，参数中还可原样传入原生 to_excel 的所有参数，以调用 to_excel 的全部功能
@@ -94,16 +115,18 @@ def better_to_excel(df, pathname, mode='a', rows_per_sheet=1000000, **kwargs):
         - 'w': (over)write, 覆写原 excel 内容
         - 'a': append，追加到原 excel 的新 sheet 中
 
-    :param int rows_per_sheet: 指定每张 sheet 的行数。默认为 1,000,000，不得大于默认值
+    :param int rows_per_sheet: 每张 sheet 的最大行数。默认为 1,000,000，不得大于默认值
+
+        超出时按所需 sheet 数均分行数，如 1,500,000 行会分为两张 750,000 行的 sheet，而非 1,000,000 + 500,000
     :return: None
     """
-    if not isinstance(rows_per_sheet, int) or (rows_per_sheet < 0):
+    if not isinstance(rows_per_sheet, int) or (rows_per_sheet <= 0):
         raise ValueError('行数必须为正整数')
 
     if rows_per_sheet > 1000000:
         raise ValueError('Excel 单张 Sheet 行数不得大于 1,000,000 行')
 
-    total_sheet_num = int(round(len(df) / rows_per_sheet, 0) + 1)
+    total_sheet_num = max(1, math.ceil(len(df) / rows_per_sheet))
 
     if not os.path.exists(pathname):
         df_empty = pd.DataFrame()
@@ -114,12 +137,11 @@ def better_to_excel(df, pathname, mode='a', rows_per_sheet=1000000, **kwargs):
         if total_sheet_num == 1:
             df.to_excel(excel_writer=writer, **kwargs)
         elif total_sheet_num > 1:
-            for i in range(total_sheet_num):
-                df_i = df.iloc[i * rows_per_sheet: i * rows_per_sheet + rows_per_sheet, :]
-                if 'sheet_name' in kwargs:
-                    df_i.to_excel(excel_writer=writer, sheet_name=f"{kwargs['sheet_name']}_{i}", **kwargs)
-                else:
-                    df_i.to_excel(excel_writer=writer, sheet_name=f'df_{i}', **kwargs)
+            # 多张 sheet 时以 sheet_name 为前缀加序号命名，默认前缀为 df
+            sheet_prefix = kwargs.pop('sheet_name', 'df')
+            # array_split 均分各 sheet 行数，保证每张都不超过 rows_per_sheet
+            for i, df_i in enumerate(np.array_split(df, total_sheet_num)):
+                df_i.to_excel(excel_writer=writer, sheet_name=f'{sheet_prefix}_{i}', **kwargs)
 
 
 if __name__ == '__main__':
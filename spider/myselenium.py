@@ -7,6 +7,7 @@ selenium 基本前期准备与其他通用动作
 提供一个准备完成的 selenium driver
 """
 
+import functools
 import os
 import random
 import time
@@ -22,28 +23,40 @@ import spider.myua as myua
 # selenium 的 page_source 不能获取到动态内容，必须通过 get_attribute('outerHTML')
 # selenium 下滚似乎也会受到防爬
 
-with open(os.path.join(os.path.dirname(__file__), 'config.yaml'), 'r', encoding='utf-8') as f:
-    config_dict = yaml.full_load(f)
+
+@functools.lru_cache(maxsize=1)
+def _config():
+    """
+    读取配置文件，首次调用时才解析并缓存结果。优先使用 libyaml 的 CSafeLoader
+
+    :return: 配置字典
+    :rtype: dict
+    """
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(os.path.join(os.path.dirname(__file__), 'config.yaml'), 'r', encoding='utf-8') as f:
+        return yaml.load(f, Loader=loader)
 
 
 class SeleniumChrome(object):
     """
     Chrome 浏览器所用 selenium 对象
 
-    :param str chrome_river: 可执行的 chrome_driver 路径
+    :param str chrome_river: 可执行的 chrome_driver 路径。默认为 None，即取配置文件中的路径
     """
 
-    def __init__(self, chrome_river=config_dict['LocalPath']['chromedriver_path']):
+    def __init__(self, chrome_river=None):
         """
 
-        :param str chrome_river: 可执行的 chrome_driver 路径
+        :param str chrome_river: 可执行的 chrome_driver 路径。默认为 None，即取配置文件中的路径
         """
+        if chrome_river is None:
+            chrome_river = _config()['LocalPath']['chromedriver_path']
         self.chrome_driver = chrome_river
         self.chrome_options = Options()
         self.ua = myua.FakeUA()
 
     def prepare(self, ua, download_path, incognito=True, no_pic=False, headless=False,
-                resolution=config_dict['BrowserConfig']['resolution']):
+                resolution=None):
         """
         预处理准备
 
@@ -69,26 +82,27 @@ class SeleniumChrome(object):
         :param boolean incognito: 是否启用匿名模式，默认是
         :param boolean no_pic: 是否不加载图片，默认加载
         :param boolean headless: 是否开启无头模式，默认不开启
-        :param list resolution: 分辨率设置
+        :param list resolution: 分辨率设置。默认为 None，即取配置文件中的分辨率
         :return: None
         """
-        self.chrome_options.add_argument('disable-infobars')
-        self.chrome_options.add_argument('--profile-directory=Default')
-        self.chrome_options.add_argument(f'--window-size={resolution[0]},{resolution[1]}')
+        if resolution is None:
+            resolution = _config()['BrowserConfig']['resolution']
+        args = ['disable-infobars', '--profile-directory=Default', f'--window-size={resolution[0]},{resolution[1]}']
 
         if isinstance(ua, dict):
-            given_ua = f'user-agent="{self.ua.get_ua(platform=ua["faker_ua"])}"'
-            self.chrome_options.add_argument(given_ua)
+            args.append(f'user-agent="{self.ua.get_ua(platform=ua["faker_ua"])}"')
 
         if isinstance(ua, str):
-            given_ua = f'user-agent="{ua}"'
-            self.chrome_options.add_argument(given_ua)
+            args.append(f'user-agent="{ua}"')
 
         if incognito:
-            self.chrome_options.add_argument('--incognito')
+            args.append('--incognito')
 
         if headless:
-            self.chrome_options.add_argument('--headless')
+            args.append('--headless')
+
+        for arg in args:
+            self.chrome_options.add_argument(arg)
 
         prefs = {'download.prompt_for_download': False,
                  'credentials_enable_service': False,
@@ -96,12 +110,12 @@ class SeleniumChrome(object):
                  }
         if download_path:
             prefs['download.default_directory'] = download_path
-        self.chrome_options.add_experimental_option('prefs', prefs)
 
-        # 不加载图片
+        # 不加载图片。prefs 需一次性设置，重复调用 add_experimental_option('prefs', ...) 会覆盖之前的设置
         if no_pic:
-            self.chrome_options.add_experimental_option('prefs',
-                                                        {'profile.managed_default_content_settings_.images': 2})
+            prefs['profile.managed_default_content_settings.images'] = 2
+
+        self.chrome_options.add_experimental_option('prefs', prefs)
 
         # 开发者模式，可以防止被 js 的'window.navigator.webdriver'识别为 selenium
         self.chrome_options.add_experimental_option('excludeSwitches', ['enable-automation'])
@@ -124,14 +138,16 @@ class SeleniumFirefox(object):
     """
     Firefox 所用 Selenium 对象
 
-    :param str gecko_driver: 可执行的 chrome_driver(firefox driver) 路径
+    :param str gecko_driver: 可执行的 chrome_driver(firefox driver) 路径。默认为 None，即取配置文件中的路径
     """
 
-    def __init__(self, gecko_driver=config_dict['LocalPath']['geckodriver_path']):
+    def __init__(self, gecko_driver=None):
         """
 
-        :param str gecko_driver: 可执行的 chrome_driver(firefox driver) 路径
+        :param str gecko_driver: 可执行的 chrome_driver(firefox driver) 路径。默认为 None，即取配置文件中的路径
         """
+        if gecko_driver is None:
+            gecko_driver = _config()['LocalPath']['geckodriver_path']
         self.gecko_driver = gecko_driver
 
     def get_driver(self):
@@ -139,7 +155,7 @@ class SeleniumFirefox(object):
         return driver
 
 
-def human_click(element, driver, sleep_time=random.uniform(0.5, 1)):
+def human_click(element, driver, sleep_time=None):
     """
     使用随机时间延迟模仿真人鼠标操作的移动、悬停、点击
 
@@ -147,9 +163,12 @@ def human_click(element, driver, sleep_time=random.uniform(0.5, 1)):
 
     :param element: 目标页面元素，如果被遮挡则点击会点击到上层遮挡物
     :param webdriver driver: selenium driver
-    :param float sleep_time: 移动、点击完成后的阻塞时长。默认取 0.5 到 1 秒的均匀分布
+    :param float sleep_time: 移动、点击完成后的阻塞时长。默认为 None，即每次调用时取 0.5 到 1 秒的均匀分布
     :return: None
     """
+    # 默认值不能直接写 random.uniform，否则只在定义函数时取值一次
+    if sleep_time is None:
+        sleep_time = random.uniform(0.5, 1)
     actions = ActionChains(driver)  # 实例化
     actions.move_to_element(element)  # 移动鼠标
     actions.click(element)  # 鼠标点击
@@ -157,46 +176,50 @@ def human_click(element, driver, sleep_time=random.uniform(0.5, 1)):
     time.sleep(sleep_time)
 
 
-def human_typewrite(element, content, interval=random.uniform(0.05, 0.1)):
+def human_typewrite(element, content, interval=None):
     """
     模拟真人输入内容，单个字符间设置输入间隔
 
     :param webelement element: 目标页面元素，一般是可供填写的文本框
     :param str content: 待输入内容
-    :param float interval: 单一字符间隔
+    :param float interval: 单一字符间隔。默认为 None，即每次调用时取 0.05 到 0.1 秒的均匀分布
     :return: None
     """
-    i = 0
-    while i < len(content):
-        element.send_keys(content[i])
-        i += 1
+    if interval is None:
+        interval = random.uniform(0.05, 0.1)
+    for ch in content:
+        element.send_keys(ch)
         time.sleep(interval)
 
 
-def scroll_down(driver, sleep_time=random.uniform(0.5, 1)):
+def scroll_down(driver, sleep_time=None):
     """
     页面下滚
 
     通过按 page down 实现
 
     :param webdriver driver: selenium driver
-    :param sleep_time: 滚动完成后的阻塞时长。默认取 0.5 到 1 秒的均匀分布
+    :param sleep_time: 滚动完成后的阻塞时长。默认为 None，即每次调用时取 0.5 到 1 秒的均匀分布
     :return: None
     """
+    if sleep_time is None:
+        sleep_time = random.uniform(0.5, 1)
     ActionChains(driver).send_keys(Keys.PAGE_DOWN).perform()  # 按下并释放
     time.sleep(sleep_time)
 
 
-def scroll_up(driver, sleep_time=random.uniform(0.5, 1)):
+def scroll_up(driver, sleep_time=None):
     """
     页面上滚
 
     通过按 page up 实现
 
     :param webdriver driver: selenium driver
-    :param sleep_time: 滚动完成后的阻塞时长。默认取 0.5 到 1 秒的均匀分布
+    :param sleep_time: 滚动完成后的阻塞时长。默认为 None，即每次调用时取 0.5 到 1 秒的均匀分布
     :return: None
     """
+    if sleep_time is None:
+        sleep_time = random.uniform(0.5, 1)
     ActionChains(driver).send_keys(Keys.PAGE_UP).perform()  # 按下并释放
     time.sleep(sleep_time)
 
@@ -7,48 +7,74 @@ User-Agent 前期准备
 更有针对性地伪装请求头
 """
 
+import random
+
 from faker import Faker
 
+# 各平台 ua 的识别子串
+PLATFORM_KEYWORDS = {'PC': 'Windows', 'mobile': 'iPhone'}
+
 
 class FakeUA(object):
     """
     随机伪装 UA
-    
+
+    每种浏览器首次使用时预先生成一批 ua 并按平台分桶缓存，之后直接从中随机抽取
+
     :param str language: 本地化语言。Default 'zh-CN'
+    :param int pool_size: 每种浏览器预先生成的 ua 数量。Default 256
     """
 
-    def __init__(self, language='zh-CN'):
+    def __init__(self, language='zh-CN', pool_size=256):
         """
 
         :param str language: 本地化语言。Default 'zh-CN'
+        :param int pool_size: 每种浏览器预先生成的 ua 数量。Default 256
         """
         self.local_faker = Faker(language)
+        self.pool_size = pool_size
+        self._pool = {}  # {browser: {'PC': [...], 'mobile': [...]}}
+
+    def _fill_pool(self, browser, pool, times, platform=None):
+        """
+        生成 times 个 ua 放入对应平台的桶中。指定 platform 时，该平台得到 ua 后即停止
+
+        :return: None
+        """
+        fake_ua_func = getattr(self.local_faker, browser)
+        for _ in range(times):
+            ua = fake_ua_func()
+            for k, keyword in PLATFORM_KEYWORDS.items():
+                if keyword in ua:
+                    pool[k].append(ua)
+            if platform is not None and pool[platform]:
+                return
 
     def get_ua(self, platform, browser='chrome'):
         """
         按指定平台和浏览器获取随机 ua
 
-        TODO: 不修改 faker 源码情况下不断尝试的时间可能比较长
-
         :param str platform: {'PC', 'mobile'}，系统平台
         :param str browser: {'chrome', 'firefox', 'safari', 'internet_explorer', 'opera'}
         :return: random user-agent
         :rtype: str
         """
-        fake_ua_func = getattr(self.local_faker, browser)
-        while True:
-            ua = fake_ua_func()
-            if platform == 'PC':
-                if 'Windows' in ua:
-                    return ua
-                else:
-                    continue
-
-            if platform == 'mobile':
-                if 'iPhone' in ua:
-                    return ua
-                else:
-                    continue
+        if platform not in PLATFORM_KEYWORDS:
+            raise ValueError('platform 参数只接受 PC 或 mobile')
+
+        pool = self._pool.get(browser)
+        if pool is None:
+            pool = {k: [] for k in PLATFORM_KEYWORDS}
+            self._fill_pool(browser, pool, times=self.pool_size)
+            self._pool[browser] = pool
+
+        # 少见平台可能没有抽到，有限次数内补充
+        if not pool[platform]:
+            self._fill_pool(browser, pool, times=50, platform=platform)
+        if not pool[platform]:
+            raise ValueError(f'{browser} 难以生成 {platform} 平台的 ua')
+
+        return random.choice(pool[platform])
 
 
 if __name__ == '__main__':